@@ -4,3 +4,5 @@
 
 
 from .pytiaclient import TIAClient, TIAError
+from .history import DataHistory
+from .simulator import TIASimulator
@@ -0,0 +1,258 @@
+# This file is part of PyTIAClient.
+# This project is licensed under the GNU GPL (version 3 or higher).
+# Copyright 2014 by Clemens Brunner.
+
+
+"""Command-line interface for monitoring, capturing and benchmarking a TIA stream.
+
+Examples
+--------
+python -m pytiaclient info --host localhost --port 9000
+python -m pytiaclient monitor --interval 1
+python -m pytiaclient capture data.json --duration 10
+python -m pytiaclient bench --simulate --duration 5
+python -m pytiaclient serve --port 9000
+
+"""
+
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from .pytiaclient import TIAClient, TIAError
+from .simulator import TIASimulator
+
+
+def main(argv=None):
+    """Runs the command-line interface.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command-line arguments (defaults to sys.argv[1:]).
+
+    Returns
+    -------
+    int
+        Exit status.
+
+    """
+    parser = argparse.ArgumentParser(prog="python -m pytiaclient", description="Monitor, capture and benchmark a TIA "
+                                                                                "data stream.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--host", default="localhost", help="TIA server host name or IP address")
+    common.add_argument("--port", type=int, default=9000, help="TIA server port")
+    common.add_argument("--simulate", action="store_true", help="connect to a local simulated TIA server")
+
+    info = subparsers.add_parser("info", parents=[common], help="print meta information")
+    info.set_defaults(func=info_cmd)
+
+    monitor = subparsers.add_parser("monitor", parents=[common], help="show live sampling rates and packet loss")
+    monitor.add_argument("--interval", type=float, default=1, help="update interval (in seconds)")
+    monitor.add_argument("--duration", type=float, help="stop after this duration (in seconds)")
+    monitor.set_defaults(func=monitor_cmd)
+
+    capture = subparsers.add_parser("capture", parents=[common], help="capture the stream to a JSON file")
+    capture.add_argument("output", help="output file name")
+    capture.add_argument("--duration", type=float, default=10, help="capture duration (in seconds)")
+    capture.set_defaults(func=capture_cmd)
+
+    bench = subparsers.add_parser("bench", parents=[common], help="measure decoding throughput")
+    bench.add_argument("--duration", type=float, default=5, help="benchmark duration (in seconds)")
+    bench.set_defaults(func=bench_cmd)
+
+    serve = subparsers.add_parser("serve", help="run a simulated TIA server")
+    serve.add_argument("--host", default="localhost", help="host name or IP address to listen on")
+    serve.add_argument("--port", type=int, default=9000, help="port to listen on (0 selects a free port)")
+    serve.add_argument("--fast", action="store_true", help="send packets as fast as possible instead of in real time")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve_cmd(args)
+
+    simulator = process = None
+    try:
+        if args.simulate and args.command == "bench":
+            # Run the simulator in a separate process so that it does not compete with the client for the GIL
+            process, args.port = start_simulator_process(args.host)
+        elif args.simulate:
+            simulator = TIASimulator(args.host, 0)
+            simulator.start()
+            args.host, args.port = simulator.address
+        client = TIAClient()
+        client.connect(args.host, args.port)
+        try:
+            args.func(client, args)
+        finally:
+            client.close()
+    except TIAError as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if simulator is not None:
+            simulator.stop()
+        if process is not None:
+            process.terminate()
+            process.wait()
+            process.stdout.close()
+    return 0
+
+
+def start_simulator_process(host):
+    """Starts a simulated TIA server sending packets as fast as possible in a subprocess.
+
+    Parameters
+    ----------
+    host : str
+        Host name or IP address to listen on.
+
+    Returns
+    -------
+    (process, port)
+        Subprocess running the server and port number of its control connection.
+
+    Raises
+    ------
+    TIAError
+        If the server cannot be started.
+
+    """
+    process = subprocess.Popen([sys.executable, "-m", "pytiaclient", "serve", "--host", host, "--port", "0", "--fast"],
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline()  # Announces the address the server is listening on
+    try:
+        return process, int(line.rsplit(":", 1)[-1])
+    except ValueError:
+        process.terminate()
+        process.wait()
+        process.stdout.close()
+        raise TIAError("Cannot start simulated TIA server.")
+
+
+def serve_cmd(args):
+    """Runs a simulated TIA server until interrupted.
+
+    """
+    simulator = TIASimulator(args.host, args.port, realtime=not args.fast)
+    simulator.start()
+    print("Simulated TIA server listening on {}:{}".format(*simulator.address))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+    return 0
+
+
+def info_cmd(client, args):
+    """Prints the meta information of the server.
+
+    """
+    metainfo = client.get_metainfo()
+    if metainfo["subject"] is not None:
+        print("Subject: " + ", ".join("{}={}".format(k, v) for k, v in metainfo["subject"].items()))
+    if metainfo["masterSignal"] is not None:
+        print("Master signal: " + ", ".join("{}={}".format(k, v) for k, v in metainfo["masterSignal"].items()))
+    for index, signal in enumerate(metainfo["signals"]):
+        print("Signal group {}: type={}, samplingRate={}, numChannels={}, blockSize={}".format(
+            index, signal.get("type"), signal.get("samplingRate"), signal.get("numChannels"), signal.get("blockSize")))
+        labels = [channel.get("label", channel.get("nr", "?")) for channel in signal["channels"]]
+        if labels:
+            print("  Channels: " + ", ".join(labels))
+
+
+def monitor_cmd(client, args):
+    """Prints per-signal-group sampling rates and stream statistics at regular intervals.
+
+    """
+    signals = client.get_metainfo()["signals"]
+    client.start_data()
+    try:
+        start = last = time.time()
+        lost = 0
+        while args.duration is None or time.time() - start < args.duration:
+            if args.duration is None:
+                time.sleep(args.interval)
+            else:
+                time.sleep(min(args.interval, max(0, args.duration - (time.time() - start))))
+            data = client.get_data_chunk()
+            now = time.time()
+            stats = client.get_stream_stats()
+            rates = ["{}: {:.1f} Hz".format(signal["type"], len(data[index][0]) / (now - last) if data[index] else 0)
+                     for index, signal in enumerate(signals)]
+            print("{} | packets: {}, lost: {} (+{}), skipped bytes: {}, resyncs: {}".format(
+                ", ".join(rates), stats["packets"], stats["lost"], stats["lost"] - lost, stats["skipped_bytes"],
+                stats["resyncs"]))
+            sys.stdout.flush()
+            last, lost = now, stats["lost"]
+    finally:
+        client.stop_data()
+
+
+def capture_cmd(client, args):
+    """Captures the stream for a fixed duration and writes it to a JSON file.
+
+    """
+    metainfo = client.get_metainfo()
+    # Same layout as returned by get_data_chunk(), so the file contains all signal groups even if no data arrives
+    data = [[[] for _ in range(int(signal["numChannels"]))] for signal in metainfo["signals"]]
+    timestamps = []
+    client.start_data()
+    try:
+        start = time.time()
+        while time.time() - start < args.duration:
+            time.sleep(min(0.1, max(0, args.duration - (time.time() - start))))
+            chunk, chunk_timestamps = client.get_data_chunk(timestamps=True)
+            for signal, channels in enumerate(chunk):
+                for channel, samples in enumerate(channels):
+                    data[signal][channel].extend(samples)
+            timestamps.extend(chunk_timestamps)
+        stats = client.get_stream_stats()
+    finally:
+        client.stop_data()
+    with open(args.output, "w") as f:
+        json.dump({"metainfo": metainfo, "timestamps": timestamps, "data": data, "stats": stats}, f)
+    print("Captured {} packets to {} (lost: {}, resyncs: {}).".format(len(timestamps), args.output, stats["lost"],
+                                                                     stats["resyncs"]))
+
+
+def bench_cmd(client, args):
+    """Measures the decoding throughput of the client.
+
+    """
+    client.start_data()
+    n_samples = 0
+    try:
+        start = time.time()
+        while time.time() - start < args.duration:
+            time.sleep(0.1)
+            data = client.get_data_chunk()
+            n_samples += sum(len(samples) for channels in data for samples in channels)
+        elapsed = time.time() - start
+        data = client.get_data_chunk()
+        n_samples += sum(len(samples) for channels in data for samples in channels)
+        stats = client.get_stream_stats()
+    finally:
+        client.stop_data()
+    print("Duration: {:.2f} s".format(elapsed))
+    print("Packets: {} ({:.1f} packets/s)".format(stats["packets"], stats["packets"] / elapsed))
+    print("Samples: {} ({:.1f} samples/s, {:.2f} MB/s)".format(n_samples, n_samples / elapsed,
+                                                              4 * n_samples / elapsed / 1e6))
+    print("Lost packets: {}, skipped bytes: {}, resyncs: {}".format(stats["lost"], stats["skipped_bytes"],
+                                                                    stats["resyncs"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+# This file is part of PyTIAClient.
+# This project is licensed under the GNU GPL (version 3 or higher).
+# Copyright 2014 by Clemens Brunner.
+
+
+"""Time-indexed data history.
+
+"""
+
+
+from array import array
+import bisect
+import threading
+
+
+TIMESTAMP_RESOLUTION = 1e-6  # Duration of one timestamp unit (in seconds)
+SAMPLE_SIZE = array("f").itemsize  # Size of one stored sample (in bytes)
+PACKET_OVERHEAD = 144  # Approximate memory used by each stored packet apart from its samples (in bytes)
+
+
+class DataHistory(object):
+    """Rolling in-memory history of received data packets.
+
+    Packets are indexed by their timestamp and packet number. Queries do not modify the history, so several readers can
+    access it concurrently without interfering with each other or with the destructive data buffer of TIAClient.
+    Samples are stored as single-precision floats (the precision used by the TIA protocol), one array per packet.
+
+    Parameters
+    ----------
+    n_channels : list of int
+        Number of channels in each signal group.
+    max_duration : float, optional
+        Maximum time span (in seconds) kept in the history. Older packets are discarded.
+    max_size : int, optional
+        Maximum memory (in bytes) used by the history, including the per-packet overhead (see size). Older packets are
+        discarded.
+
+    """
+
+    def __init__(self, n_channels, max_duration=None, max_size=None):
+        self._n_channels = list(n_channels)
+        self._max_duration = max_duration
+        self._max_size = max_size
+        self._lock = threading.RLock()
+        self._shape_cache = {}
+        self._clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._timestamps) - self._start
+
+    @property
+    def size(self):
+        """Approximate memory (in bytes) used by the packets currently kept in the history.
+
+        Each packet accounts for SAMPLE_SIZE bytes per sample plus PACKET_OVERHEAD bytes for the packet itself.
+
+        """
+        with self._lock:
+            return self._size
+
+    def clear(self):
+        """Removes all packets from the history.
+
+        """
+        with self._lock:
+            self._clear()
+
+    def append(self, number, timestamp, data):
+        """Adds a data packet to the history.
+
+        Packets must be appended in order of increasing packet numbers and non-decreasing timestamps; other packets are
+        ignored so that the history stays sorted.
+
+        Parameters
+        ----------
+        number : int
+            Packet number (d_number).
+        timestamp : int
+            Packet timestamp (d_timestamp).
+        data : list
+            Samples contained in the packet; data[signal][channel] is a list of samples.
+
+        Returns
+        -------
+        bool
+            True if the packet was added, False if it was ignored.
+
+        """
+        shape = tuple(tuple(len(channel) for channel in signal) for signal in data)
+        samples = array("f")
+        for signal in data:
+            for channel in signal:
+                samples.extend(channel)
+        size = SAMPLE_SIZE * len(samples) + PACKET_OVERHEAD
+        with self._lock:
+            if len(self._timestamps) > self._start and (number <= self._numbers[-1] or
+                                                        timestamp < self._timestamps[-1]):
+                return False
+            shape = self._shape_cache.setdefault(shape, shape)  # All packets with the same shape share one tuple
+            self._numbers.append(number)
+            self._timestamps.append(timestamp)
+            self._shapes.append(shape)
+            self._packets.append(samples)
+            self._sizes.append(size)
+            self._size += size
+            self._trim()
+            return True
+
+    def get_range(self, t_start, t_end, timestamps=False):
+        """Returns all packets with timestamps in the interval [t_start, t_end].
+
+        Parameters
+        ----------
+        t_start : int
+            Start timestamp (inclusive).
+        t_end : int
+            End timestamp (inclusive).
+        timestamps : bool
+            If set to True, the function returns a tuple consisting of data and timestamps; otherwise, it returns only
+            the data.
+
+        Returns
+        -------
+        buffer or (buffer, timestamps)
+            Data in the same layout as returned by TIAClient.get_data_chunk().
+
+        """
+        with self._lock:
+            lo = bisect.bisect_left(self._timestamps, t_start, self._start)
+            hi = bisect.bisect_right(self._timestamps, t_end, lo)
+            return self._collect(lo, hi, timestamps)
+
+    def get_numbers(self, n_start, n_end, timestamps=False):
+        """Returns all packets with packet numbers in the interval [n_start, n_end].
+
+        Parameters
+        ----------
+        n_start : int
+            First packet number (inclusive).
+        n_end : int
+            Last packet number (inclusive).
+        timestamps : bool
+            If set to True, the function returns a tuple consisting of data and timestamps; otherwise, it returns only
+            the data.
+
+        Returns
+        -------
+        buffer or (buffer, timestamps)
+            Data in the same layout as returned by TIAClient.get_data_chunk().
+
+        """
+        with self._lock:
+            lo = bisect.bisect_left(self._numbers, n_start, self._start)
+            hi = bisect.bisect_right(self._numbers, n_end, lo)
+            return self._collect(lo, hi, timestamps)
+
+    def get_latest(self, duration, timestamps=False):
+        """Returns all packets received within the given duration before the most recent packet.
+
+        Parameters
+        ----------
+        duration : float
+            Duration (in seconds).
+        timestamps : bool
+            If set to True, the function returns a tuple consisting of data and timestamps; otherwise, it returns only
+            the data.
+
+        Returns
+        -------
+        buffer or (buffer, timestamps)
+            Data in the same layout as returned by TIAClient.get_data_chunk().
+
+        """
+        with self._lock:
+            hi = len(self._timestamps)
+            if hi == self._start:
+                return self._collect(hi, hi, timestamps)
+            t_start = self._timestamps[-1] - duration / TIMESTAMP_RESOLUTION
+            lo = bisect.bisect_left(self._timestamps, t_start, self._start)
+            return self._collect(lo, hi, timestamps)
+
+    def _collect(self, lo, hi, timestamps):
+        """Concatenates packets lo to hi - 1 into a new buffer.
+
+        """
+        buffer = [[[] for _ in range(n)] for n in self._n_channels]
+        for index in range(lo, hi):
+            samples = self._packets[index]
+            offset = 0
+            for signal, channels in enumerate(self._shapes[index]):
+                for channel, n_samples in enumerate(channels):
+                    buffer[signal][channel].extend(samples[offset:offset + n_samples])
+                    offset += n_samples
+        if timestamps:
+            return buffer, self._timestamps[lo:hi].tolist()
+        else:
+            return buffer
+
+    def _trim(self):
+        """Discards the oldest packets until the history satisfies its duration and size limits.
+
+        """
+        end = len(self._timestamps)
+        if self._max_duration is not None:
+            t_min = self._timestamps[-1] - self._max_duration / TIMESTAMP_RESOLUTION
+            start = bisect.bisect_left(self._timestamps, t_min, self._start)
+            while self._start < start:
+                self._discard()
+        if self._max_size is not None:
+            while self._size > self._max_size and self._start < end:
+                self._discard()
+
+        # Discarded packets are only marked by self._start; compact the lists once they make up half of the entries
+        if self._start > 0 and self._start * 2 >= end:
+            del self._numbers[:self._start]
+            del self._timestamps[:self._start]
+            del self._shapes[:self._start]
+            del self._packets[:self._start]
+            del self._sizes[:self._start]
+            self._start = 0
+
+    def _discard(self):
+        """Discards the oldest packet and releases its samples.
+
+        """
+        self._size -= self._sizes[self._start]
+        self._packets[self._start] = None
+        self._start += 1
+
+    def _clear(self):
+        """Initializes an empty history.
+
+        """
+        self._start = 0  # Index of the oldest valid packet
+        self._numbers = array("Q")
+        self._timestamps = array("Q")
+        self._shapes = []  # Number of samples for each channel in each packet
+        self._packets = []  # Samples of each packet as a flat array
+        self._sizes = array("Q")
+        self._size = 0
@@ -8,15 +8,16 @@
 """
 
 
+import copy
 import socket
 import threading
 import struct
 import xml.etree.ElementTree as ElementTree
 
 from .utils import recv_until, bitcount
+from .history import DataHistory
 
 # TODO: Include logger
-# TODO: Include unit tests?
 
 
 __version__ = "1.0.0"
@@ -25,6 +26,12 @@ __version__ = "1.0.0"
 SOCKET_TIMEOUT = 2  # Socket timeout (in seconds)
 TIA_VERSION = 1.0
 FIXED_HEADER_SIZE = 33  # Fixed header size (in bytes)
+RECV_SIZE = 65536  # Maximum number of bytes read from the data socket at once
+DATA_PACKET_VERSION = 3  # Data packet version used by TiA 1.0
+DATA_PACKET_VERSION_BYTE = struct.pack("<B", DATA_PACKET_VERSION)
+MAX_NUMBER_GAP = 1000  # Maximum plausible increase of the packet number between consecutive packets
+MAX_TIMESTAMP_GAP = 10000000  # Maximum plausible timestamp increase between consecutive packets (in microseconds)
+REANCHOR_PACKETS = 3  # Number of consecutive packets required to accept a new packet sequence
 BUFFER_SIZE = 2  # TODO: Implement buffer size limit
 SIGNAL_TYPES = {"eeg": 0, "emg": 1, "eog": 2, "ecg": 3, "hr": 4, "bp": 5, "button": 6,
                 "axes": 7, "sensor": 8, "nirs": 9, "fmri": 10, "keycode": 11,
@@ -38,9 +45,17 @@ class TIAClient(object):
     Provides methods to connect to a TIA server, receive meta information about the streams, and stream data over the
     network.
 
+    Parameters
+    ----------
+    history_duration : float, optional
+        If set, keeps a non-destructive history of the most recent data spanning this duration (in seconds).
+    history_size : int, optional
+        If set, keeps a non-destructive history of the most recent data using at most about this much memory (in
+        bytes).
+
     """
 
-    def __init__(self):
+    def __init__(self, history_duration=None, history_size=None):
         self._sock_ctrl = None  # Socket for control connection
         self._sock_data = None  # Socket for data connection
         self._metainfo = {"subject": None, "masterSignal": None, "signals": []}
@@ -51,6 +66,12 @@ class TIAClient(object):
         self._buffer_avail = None
         self._buffer_type = []
         self._buffer_empty = True
+        self._flags_mask = 0  # Flags of all signal types announced in the meta information
+        self._layouts = {}  # Cached packet layouts for each combination of flags
+        self._reset_stream()
+        self._history_duration = history_duration
+        self._history_size = history_size
+        self._history = None
 
     def connect(self, host, port):
         """Connects to TIA server and establishes control connection.
@@ -90,7 +111,7 @@ class TIAClient(object):
             If the connection cannot be closed.
 
         """
-        if self._sock_data is not None:  # Stop data transmission (if running)
+        if self._data_thread is not None:  # Stop data transmission (if running)
             self.stop_data()
         if self._sock_ctrl is not None:
             self._sock_ctrl.close()
@@ -136,6 +157,10 @@ class TIAClient(object):
         if status != b"OK":
             raise TIAError("Starting data transmission failed.")
         self._clear_buffer()
+        self._reset_stream()
+        if self._history_duration is not None or self._history_size is not None:
+            self._history = DataHistory([int(signal["numChannels"]) for signal in self._metainfo["signals"]],
+                                        self._history_duration, self._history_size)
         self._thread_running = True
         self._data_thread = threading.Thread(target=self._get_data)
         self._buffer_lock = threading.RLock()
@@ -146,9 +171,10 @@ class TIAClient(object):
         """Stops data transmission.
 
         """
-        if self._thread_running:
+        if self._data_thread is not None:  # The thread might have terminated already (server closed connection)
             self._thread_running = False  # The data socket is closed in _get_data() when the thread terminates
             self._data_thread.join()
+            self._data_thread = None
 
     def get_data_chunk(self, blocking=False, timestamps=False):
         """Returns the data buffer and clears it.
@@ -174,7 +200,7 @@ class TIAClient(object):
         Raises
         ------
         TIAError
-            If the data transmission has not been started.
+            If the data transmission has not been started, or if it stops while waiting for data.
 
         """
         if not self._thread_running:
@@ -182,6 +208,8 @@ class TIAClient(object):
 
         with self._buffer_lock:
             while self._buffer_empty and blocking:
+                if not self._thread_running:
+                    raise TIAError("Data transmission stopped while waiting for data.")
                 self._buffer_avail.wait()
             data = self._buffer
             time = self._timestamps
@@ -191,6 +219,85 @@ class TIAClient(object):
             else:
                 return data
 
+    def get_metainfo(self):
+        """Returns the meta information received from the server.
+
+        Returns
+        -------
+        dict
+            Copy of the meta information with keys "subject", "masterSignal" and "signals"; each signal group contains
+            its attributes and a list of its channels ("channels").
+
+        """
+        return copy.deepcopy(self._metainfo)
+
+    def get_stream_stats(self):
+        """Returns statistics about the received data stream.
+
+        Returns
+        -------
+        dict
+            Contains the number of valid packets ("packets"), the number of packets missing from the sequence of packet
+            numbers ("lost"), the number of bytes skipped because of stream corruption ("skipped_bytes"), and the number
+            of resynchronization events ("resyncs").
+
+        """
+        return dict(self._stream_stats)
+
+    def get_range(self, t_start, t_end, timestamps=False):
+        """Returns data with timestamps in the interval [t_start, t_end] from the history without clearing it.
+
+        Parameters
+        ----------
+        t_start : int
+            Start timestamp (inclusive).
+        t_end : int
+            End timestamp (inclusive).
+        timestamps : bool
+            If set to True, the function returns a tuple consisting of data and
+            timestamps; otherwise, it returns only the data.
+
+        Returns
+        -------
+        buffer or (buffer, timestamps)
+            Data in the same layout as returned by get_data_chunk().
+
+        Raises
+        ------
+        TIAError
+            If the history is not enabled.
+
+        """
+        if self._history is None:
+            raise TIAError("History is not enabled.")
+        return self._history.get_range(t_start, t_end, timestamps)
+
+    def get_latest(self, duration, timestamps=False):
+        """Returns data received within the last duration seconds from the history without clearing it.
+
+        Parameters
+        ----------
+        duration : float
+            Duration (in seconds).
+        timestamps : bool
+            If set to True, the function returns a tuple consisting of data and
+            timestamps; otherwise, it returns only the data.
+
+        Returns
+        -------
+        buffer or (buffer, timestamps)
+            Data in the same layout as returned by get_data_chunk().
+
+        Raises
+        ------
+        TIAError
+            If the history is not enabled.
+
+        """
+        if self._history is None:
+            raise TIAError("History is not enabled.")
+        return self._history.get_latest(duration, timestamps)
+
     def get_state_connection(self):
         """Creates a state connection.
 
@@ -263,6 +370,10 @@ class TIAClient(object):
                     SIGNAL_TYPES[signal["type"]])  # Assign corresponding signal type to each signal group
             except KeyError:
                 raise TIAError("Unknown signal type found.")
+        self._flags_mask = 0
+        for signal_type in self._buffer_type:
+            self._flags_mask |= 1 << signal_type
+        self._layouts = {}
 
     def _get_data_connection(self, connection):
         """Determines the port number of the new data connection.
@@ -301,54 +412,283 @@ class TIAClient(object):
     def _get_data(self):
         """Receive data from server and store it in buffer.
 
+        Incoming bytes are collected in a stream buffer and split into packets. Each packet is validated before it is
+        decoded; if the stream is corrupted, it is scanned for the next plausible header instead of closing the
+        connection.
+
         Raises
         ------
         TIAError
             If the data connection cannot be closed properly.
 
         """
+        stream = bytearray()
+        closed = False  # Indicates if the server closed the data connection
         while self._thread_running:
-            d_version, d_size, d_flags, d_id, d_number, d_timestamp = struct.unpack("<BIIQQQ", self._sock_data.recv(
-                FIXED_HEADER_SIZE))  # Get fixed header
-            signal_types = bitcount(d_flags)  # Lists the signal types present in the data packet
-            signal_list = [self._buffer_type.index(k) for k in signal_types]  # Indices into the buffer
+            try:
+                chunk = self._sock_data.recv(RECV_SIZE)
+            except socket.timeout:
+                continue
+            except socket.error:
+                chunk = b""
+            if not chunk:
+                closed = True
+                break
+            stream.extend(chunk)
+            del stream[:self._parse_stream(stream)]
+
+        with self._buffer_lock:  # Wake up readers waiting for data
+            self._thread_running = False
+            self._buffer_avail.notify_all()
+
+        try:
+            if not closed:  # Stop data transmission
+                try:
+                    self._sock_ctrl.sendall("TiA {}\nStopDataTransmission\n\n".format(TIA_VERSION).encode("ascii"))
+                    tia_version = recv_until(self._sock_ctrl).strip()
+                    status = recv_until(self._sock_ctrl).strip()
+                    self._sock_ctrl.recv(1)
+                except (socket.error, EOFError):
+                    raise TIAError("Stopping data transmission failed.")
+        finally:
+            self._sock_data.close()
+            self._sock_data = None
+
+    def _parse_stream(self, stream):
+        """Decodes all complete packets in the stream buffer and stores them in the buffer.
+
+        Parameters
+        ----------
+        stream : bytearray
+            Received data.
 
+        Returns
+        -------
+        int
+            Number of bytes consumed; the remaining bytes belong to an incomplete packet.
+
+        """
+        pos = 0
+        while len(stream) - pos >= FIXED_HEADER_SIZE:
+            layout = self._check_header(stream, pos)
+            if layout is None:
+                pos = self._resync(stream, pos)
+                continue
+            signal_list, n_channels, block_size, packet_size = layout
+            if len(stream) - pos < packet_size:  # Wait for the rest of the packet
+                break
             n_signals = len(signal_list)
-            var_header_size = 4 * n_signals
-
-            # FIXME: I don't know if these values are needed at all; I could just skip over the variable header
-            # FIXME: After all, these values are available in the meta information!
-            n_channels = []
-            block_size = []
-            for signals in range(n_signals):
-                tmp = struct.unpack("<H", self._sock_data.recv(2))
-                n_channels.append(tmp[0])
-            for signals in range(n_signals):
-                tmp = struct.unpack("<H", self._sock_data.recv(2))
-                block_size.append(tmp[0])
+            var_header = struct.unpack_from("<{}H".format(2 * n_signals), stream, pos + FIXED_HEADER_SIZE)
+            if list(var_header) != n_channels + block_size or self._truncated(stream, pos, packet_size):
+                pos = self._resync(stream, pos)
+                continue
+            d_number, d_timestamp = struct.unpack_from("<QQ", stream, pos + 17)
+            if self._last_number is not None and not self._follows(d_number, d_timestamp, self._last_number,
+                                                                   self._last_timestamp):
+                # Either d_number/d_timestamp are corrupted or the server started a new sequence; only accept the new
+                # sequence once enough consecutive packets agree with it
+                if self._candidate is not None and self._follows(d_number, d_timestamp, *self._candidate):
+                    self._candidate_count += 1
+                else:
+                    self._candidate_count = 1
+                self._candidate = d_number, d_timestamp
+                if self._candidate_count < REANCHOR_PACKETS:
+                    self._skip(packet_size)
+                    pos += packet_size
+                    continue
+                self._last_number = None  # Re-anchor without counting the jump as lost packets
+                if self._history is not None:
+                    self._history.clear()  # Old packets cannot be ordered relative to the new sequence
+            self._resyncing = False
+            self._candidate = None
+            self._candidate_count = 0
+            if self._last_number is not None:
+                self._stream_stats["lost"] += d_number - self._last_number - 1
+            self._last_number = d_number
+            self._last_timestamp = d_timestamp
+            self._stream_stats["packets"] += 1
+
+            offset = pos + FIXED_HEADER_SIZE + 4 * n_signals
+            packet = [[[] for _ in channels] for channels in self._buffer]
+            for index, signal in enumerate(signal_list):  # Read signal blocks; signal is the index into the buffer
+                for channel in range(n_channels[index]):
+                    n_samples = block_size[index]
+                    packet[signal][channel] = list(struct.unpack_from("<{}f".format(n_samples), stream, offset))
+                    offset += 4 * n_samples
+            pos += packet_size
+
+            if self._history is not None:
+                self._history.append(d_number, d_timestamp, packet)
 
             with self._buffer_lock:
                 self._timestamps.append(d_timestamp)
-                for index, signal in enumerate(signal_list):  # Read signal blocks; signal is the index into the buffer
-                    for channel in range(n_channels[index]):
-                        for sample in range(block_size[index]):
-                            data = struct.unpack("<f", self._sock_data.recv(4))[0]
-                            self._buffer[signal][channel].append(data)
+                for signal, channels in enumerate(packet):
+                    for channel, samples in enumerate(channels):
+                        self._buffer[signal][channel].extend(samples)
                 self._buffer_empty = False
                 self._buffer_avail.notify_all()
 
                 # TODO: Check for size of self._buffer and delete oldest sample if buffer is too big
+        return pos
 
-        # Stop data transmission        
+    def _check_header(self, stream, pos):
+        """Checks if the fixed header at the given position is plausible.
+
+        Parameters
+        ----------
+        stream : bytearray
+            Received data.
+        pos : int
+            Start position of the header (at least FIXED_HEADER_SIZE bytes must be available).
+
+        Returns
+        -------
+        tuple or None
+            Packet layout (see _get_layout()) if the header is plausible, None otherwise.
+
+        """
+        d_version, d_size, d_flags, d_id, d_number, d_timestamp = struct.unpack_from("<BIIQQQ", stream, pos)
+        if d_version != DATA_PACKET_VERSION:
+            return None
+        if d_flags == 0 or d_flags & ~self._flags_mask:  # Unknown signal types
+            return None
+        layout = self._get_layout(d_flags)
+        if d_size != layout[3]:
+            return None
+        return layout
+
+    def _truncated(self, stream, pos, packet_size):
+        """Checks if the packet at the given position was cut short by the start of the next packet.
+
+        The packet is considered truncated if a plausible header starts within the packet, unless the byte following
+        the packet starts a new packet. If the packet ends exactly at the end of the received data, it is always
+        scanned, because a short write followed by a partial packet can end at this position.
+
+        Parameters
+        ----------
+        stream : bytearray
+            Received data.
+        pos : int
+            Start position of the packet.
+        packet_size : int
+            Expected packet size (in bytes).
+
+        Returns
+        -------
+        bool
+            True if the packet is truncated.
+
+        """
+        end = pos + packet_size
+        if end < len(stream) and stream[end] == DATA_PACKET_VERSION:
+            return False
+        next_pos = stream.find(DATA_PACKET_VERSION_BYTE, pos + 1, end)
+        while next_pos != -1:
+            if len(stream) - next_pos >= FIXED_HEADER_SIZE and self._check_header(stream, next_pos) is not None:
+                return True
+            next_pos = stream.find(DATA_PACKET_VERSION_BYTE, next_pos + 1, end)
+        return False
+
+    def _get_layout(self, flags):
+        """Returns the expected layout of a data packet (cached for each combination of flags).
+
+        Parameters
+        ----------
+        flags : int
+            Signal type flags of the packet.
+
+        Returns
+        -------
+        (signal_list, n_channels, block_size, packet_size)
+            Indices into the buffer, number of channels and block size for each signal group, and total packet size
+            (in bytes).
+
+        """
         try:
-            self._sock_ctrl.sendall("TiA {}\nStopDataTransmission\n\n".format(TIA_VERSION).encode("ascii"))
-            tia_version = recv_until(self._sock_ctrl).strip()
-            status = recv_until(self._sock_ctrl).strip()
-            self._sock_ctrl.recv(1)
-        except (socket.error, EOFError):
-            raise TIAError("Stopping data transmission failed.")
-        self._sock_data.close()
-        self._sock_data = None
+            return self._layouts[flags]
+        except KeyError:
+            pass
+        signal_types = bitcount(flags)  # Lists the signal types present in the data packet
+        signal_list = [self._buffer_type.index(k) for k in signal_types]  # Indices into the buffer
+        signals = self._metainfo["signals"]
+        n_channels = [int(signals[index]["numChannels"]) for index in signal_list]
+        block_size = [int(signals[index]["blockSize"]) for index in signal_list]
+        packet_size = (FIXED_HEADER_SIZE + 4 * len(signal_list) +
+                       4 * sum(c * b for c, b in zip(n_channels, block_size)))
+        self._layouts[flags] = signal_list, n_channels, block_size, packet_size
+        return self._layouts[flags]
+
+    def _resync(self, stream, pos):
+        """Skips corrupted data until the next possible header start.
+
+        Parameters
+        ----------
+        stream : bytearray
+            Received data.
+        pos : int
+            Start position of the rejected header.
+
+        Returns
+        -------
+        int
+            Position of the next byte that matches the data packet version.
+
+        """
+        new_pos = stream.find(DATA_PACKET_VERSION_BYTE, pos + 1)
+        if new_pos == -1:
+            new_pos = len(stream)
+        self._skip(new_pos - pos)
+        return new_pos
+
+    def _skip(self, n_bytes):
+        """Records skipped bytes in the stream statistics.
+
+        Parameters
+        ----------
+        n_bytes : int
+            Number of skipped bytes.
+
+        """
+        if not self._resyncing:  # Consecutive rejected candidates count as a single resync event
+            self._resyncing = True
+            self._stream_stats["resyncs"] += 1
+        self._stream_stats["skipped_bytes"] += n_bytes
+
+    @staticmethod
+    def _follows(number, timestamp, last_number, last_timestamp):
+        """Checks if a packet plausibly follows the previous packet.
+
+        Parameters
+        ----------
+        number : int
+            Packet number.
+        timestamp : int
+            Packet timestamp.
+        last_number : int
+            Number of the previous packet.
+        last_timestamp : int
+            Timestamp of the previous packet.
+
+        Returns
+        -------
+        bool
+            True if the packet number increases by at most MAX_NUMBER_GAP and the timestamp does not decrease and
+            increases by at most MAX_TIMESTAMP_GAP.
+
+        """
+        return (0 < number - last_number <= MAX_NUMBER_GAP and
+                0 <= timestamp - last_timestamp <= MAX_TIMESTAMP_GAP)
+
+    def _reset_stream(self):
+        """Resets the stream state and statistics.
+
+        """
+        self._last_number = None  # Number of the last valid packet
+        self._last_timestamp = None  # Timestamp of the last valid packet
+        self._candidate = None  # Number and timestamp of the last out-of-sequence packet
+        self._candidate_count = 0  # Number of consecutive out-of-sequence packets agreeing with each other
+        self._resyncing = False
+        self._stream_stats = {"packets": 0, "lost": 0, "skipped_bytes": 0, "resyncs": 0}
 
     def _clear_buffer(self):
         """Initializes an empty buffer.
@@ -0,0 +1,246 @@
+# This file is part of PyTIAClient.
+# This project is licensed under the GNU GPL (version 3 or higher).
+# Copyright 2014 by Clemens Brunner.
+
+
+"""Simulated TIA server.
+
+"""
+
+
+import math
+import socket
+import struct
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+
+from .pytiaclient import TIA_VERSION, FIXED_HEADER_SIZE, DATA_PACKET_VERSION, SIGNAL_TYPES, TIAError
+from .utils import recv_until
+
+
+DEFAULT_SIGNALS = [{"type": "eeg", "samplingRate": 256, "numChannels": 8, "blockSize": 8},
+                   {"type": "button", "samplingRate": 32, "numChannels": 1, "blockSize": 1}]
+PERIOD = 16  # Period of the simulated sine waves (in packets)
+BATCH_SIZE = 64  # Number of packets sent at once if packets are sent as fast as possible
+
+
+class TIASimulator(object):
+    """Simulated TIA server streaming sine waves over TCP.
+
+    Parameters
+    ----------
+    host : str
+        Host name or IP address to listen on.
+    port : int
+        Port number of the control connection (0 selects a free port).
+    signals : list of dict, optional
+        Signal groups with keys "type", "samplingRate", "numChannels" and "blockSize". All signal groups are sent in
+        every packet, so they should share the same packet rate (samplingRate / blockSize).
+    realtime : bool
+        If set to True, packets are sent at the rate given by the first signal group; otherwise, packets are sent as
+        fast as possible (useful for benchmarks).
+
+    """
+
+    def __init__(self, host="localhost", port=0, signals=None, realtime=True):
+        self._signals = DEFAULT_SIGNALS if signals is None else signals
+        self._realtime = realtime
+        self._sock_ctrl = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock_ctrl.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock_ctrl.bind((host, port))
+        self._sock_ctrl.listen(1)
+        self._running = False
+        self._ctrl_thread = None
+        self._streaming = False
+        self._stream_lock = threading.Lock()  # Streaming is stopped from both the server thread and stop()
+        self._data_thread = None
+        self._sock_listen = None
+        self._sock_data = None
+
+    @property
+    def address(self):
+        """Host and port of the control connection.
+
+        """
+        return self._sock_ctrl.getsockname()[:2]
+
+    def start(self):
+        """Starts accepting client connections in a background thread.
+
+        """
+        self._running = True
+        self._ctrl_thread = threading.Thread(target=self._serve)
+        self._ctrl_thread.daemon = True
+        self._ctrl_thread.start()
+
+    def stop(self):
+        """Stops the server.
+
+        """
+        self._running = False
+        self._stop_streaming()
+        try:
+            self._sock_ctrl.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self._sock_ctrl.close()
+
+    def _serve(self):
+        """Handles client connections one at a time.
+
+        """
+        while self._running:
+            try:
+                conn, _ = self._sock_ctrl.accept()
+            except socket.error:
+                break
+            with conn:
+                try:
+                    self._handle(conn)
+                except (socket.error, EOFError):
+                    pass
+            self._stop_streaming()
+
+    def _handle(self, conn):
+        """Answers control messages of a connected client.
+
+        Parameters
+        ----------
+        conn : socket
+            Control connection.
+
+        """
+        header = "TiA {}\n".format(TIA_VERSION)
+        while self._running:
+            recv_until(conn)  # Protocol version line
+            command = recv_until(conn).strip().decode("ascii")
+            recv_until(conn)  # Empty line terminating the message
+            if command in ("CheckProtocolVersion", "StartDataTransmission", "StopDataTransmission"):
+                if command == "StartDataTransmission":
+                    self._start_streaming()
+                elif command == "StopDataTransmission":
+                    self._stop_streaming()
+                conn.sendall((header + "OK\n\n").encode("ascii"))
+            elif command == "GetMetaInfo":
+                xml_string = self._metainfo()
+                conn.sendall((header + "MetaInfo\nContent-Length:{}\n".format(len(xml_string))).encode("ascii") +
+                             xml_string + b"\n")
+            elif command.startswith("GetDataConnection"):
+                port = self._listen_data(conn.getsockname()[0])
+                conn.sendall((header + "DataConnectionPort:{}\n\n".format(port)).encode("ascii"))
+            else:
+                conn.sendall((header + "Error -- Unknown command\n\n").encode("ascii"))
+
+    def _metainfo(self):
+        """Creates the XML meta information.
+
+        Returns
+        -------
+        bytes
+            XML meta information.
+
+        """
+        root = ElementTree.Element("tiaMetaInfo", version=str(TIA_VERSION))
+        ElementTree.SubElement(root, "subject", id="simulated")
+        first = self._signals[0]
+        ElementTree.SubElement(root, "masterSignal", samplingRate=str(first["samplingRate"]),
+                               blockSize=str(first["blockSize"]))
+        for signal in self._signals:
+            element = ElementTree.SubElement(root, "signal", {key: str(value) for key, value in signal.items()})
+            for nr in range(signal["numChannels"]):
+                ElementTree.SubElement(element, "channel", nr=str(nr + 1), label="{}{}".format(signal["type"], nr + 1))
+        return ElementTree.tostring(root)
+
+    def _listen_data(self, host):
+        """Opens a listening socket for the data connection.
+
+        Returns
+        -------
+        int
+            Port number of the data connection.
+
+        """
+        if self._sock_listen is not None:
+            self._sock_listen.close()
+        self._sock_listen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock_listen.bind((host, 0))
+        self._sock_listen.listen(1)
+        return self._sock_listen.getsockname()[1]
+
+    def _start_streaming(self):
+        """Accepts the data connection and starts sending packets.
+
+        """
+        if self._sock_listen is None:
+            raise TIAError("Data connection has not been requested.")
+        sock_data, _ = self._sock_listen.accept()
+        self._sock_listen.close()
+        self._sock_listen = None
+        with self._stream_lock:
+            self._sock_data = sock_data
+            self._streaming = True
+            self._data_thread = threading.Thread(target=self._send_data, args=(sock_data,))
+            self._data_thread.daemon = True
+            self._data_thread.start()
+
+    def _stop_streaming(self):
+        """Stops sending packets and closes the data connection.
+
+        """
+        with self._stream_lock:
+            self._streaming = False
+            if self._sock_data is not None:
+                try:
+                    self._sock_data.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                self._sock_data.close()
+                self._sock_data = None
+            if self._data_thread is not None:
+                self._data_thread.join()
+                self._data_thread = None
+
+    def _send_data(self, sock):
+        """Sends data packets until streaming is stopped.
+
+        Parameters
+        ----------
+        sock : socket
+            Data connection.
+
+        """
+        flags = 0
+        for signal in self._signals:
+            flags |= 1 << SIGNAL_TYPES[signal["type"]]
+        # Signal groups must be ordered by signal type within a packet
+        signals = sorted(self._signals, key=lambda signal: SIGNAL_TYPES[signal["type"]])
+        var_header = struct.pack("<{}H".format(2 * len(signals)), *([s["numChannels"] for s in signals] +
+                                                                  [s["blockSize"] for s in signals]))
+        n_samples = sum(s["numChannels"] * s["blockSize"] for s in signals)
+        size = FIXED_HEADER_SIZE + len(var_header) + 4 * n_samples
+        interval = self._signals[0]["blockSize"] / float(self._signals[0]["samplingRate"])
+        header = struct.Struct("<BIIQQQ")
+
+        # Sine waves repeat every PERIOD packets, so all payloads are packed once in advance
+        sample = struct.Struct("<{}f".format(n_samples))
+        payloads = [var_header + sample.pack(*[math.sin(2 * math.pi * (number + k / float(n_samples)) / PERIOD)
+                                               for k in range(n_samples)])
+                    for number in range(PERIOD)]
+        batch = 1 if self._realtime else BATCH_SIZE
+
+        number = 0
+        start = time.time()
+        while self._streaming:
+            timestamp = int((time.time() - start) * 1e6)
+            packets = [header.pack(DATA_PACKET_VERSION, size, flags, 0, n, timestamp) + payloads[n % PERIOD]
+                       for n in range(number, number + batch)]
+            try:
+                sock.sendall(b"".join(packets))
+            except socket.error:
+                break
+            number += batch
+            if self._realtime:
+                delay = start + number * interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
@@ -0,0 +1,111 @@
+# This file is part of PyTIAClient.
+# This project is licensed under the GNU GPL (version 3 or higher).
+# Copyright 2014 by Clemens Brunner.
+
+
+from pytiaclient import DataHistory
+from pytiaclient.history import SAMPLE_SIZE, PACKET_OVERHEAD
+
+
+def packet(value):
+    """Creates a packet with two signal groups (2 channels with 2 samples, 1 channel with 1 sample)."""
+    return [[[value, value], [-value, -value]], [[value]]]
+
+
+def fill(history, n, step=1000):
+    for number in range(n):
+        assert history.append(number, number * step, packet(float(number)))
+
+
+def test_empty():
+    history = DataHistory([2, 1])
+    assert len(history) == 0
+    assert history.get_latest(1, timestamps=True) == ([[[], []], [[]]], [])
+    assert history.get_range(0, 10 ** 9) == [[[], []], [[]]]
+
+
+def test_get_range_inclusive():
+    history = DataHistory([2, 1])
+    fill(history, 10)
+    data, timestamps = history.get_range(2000, 4000, timestamps=True)
+    assert timestamps == [2000, 3000, 4000]
+    assert data == [[[2.0, 2.0, 3.0, 3.0, 4.0, 4.0], [-2.0, -2.0, -3.0, -3.0, -4.0, -4.0]], [[2.0, 3.0, 4.0]]]
+    assert history.get_range(1500, 2500, timestamps=True)[1] == [2000]
+    assert history.get_range(1001, 1999, timestamps=True)[1] == []
+
+
+def test_get_numbers_inclusive():
+    history = DataHistory([2, 1])
+    fill(history, 10)
+    assert history.get_numbers(3, 5, timestamps=True)[1] == [3000, 4000, 5000]
+    assert history.get_numbers(9, 100)[1] == [[9.0]]
+    assert history.get_numbers(10, 100)[1] == [[]]
+
+
+def test_get_latest():
+    history = DataHistory([2, 1])
+    fill(history, 10)
+    assert history.get_latest(0.002, timestamps=True)[1] == [7000, 8000, 9000]
+    assert history.get_latest(0, timestamps=True)[1] == [9000]
+
+
+def test_queries_are_not_destructive():
+    history = DataHistory([2, 1])
+    fill(history, 5)
+    assert history.get_latest(1) == history.get_latest(1)
+    assert len(history) == 5
+
+
+def test_max_duration():
+    history = DataHistory([2, 1], max_duration=0.0045)
+    fill(history, 20)
+    assert len(history) == 5
+    assert history.get_latest(1, timestamps=True)[1] == [15000, 16000, 17000, 18000, 19000]
+    assert history.size == 5 * (5 * SAMPLE_SIZE + PACKET_OVERHEAD)
+
+
+def test_max_size():
+    packet_size = 5 * SAMPLE_SIZE + PACKET_OVERHEAD
+    history = DataHistory([2, 1], max_size=3 * packet_size + 1)
+    fill(history, 20)
+    assert len(history) == 3
+    assert history.size == 3 * packet_size
+    assert history.get_numbers(0, 100, timestamps=True)[1] == [17000, 18000, 19000]
+
+
+def test_compaction():
+    history = DataHistory([2, 1], max_duration=0.0035)
+    for number in range(4):
+        history.append(number, number * 1000, packet(float(number)))
+    assert history._start == 0
+    history.append(4, 4000, packet(4.0))  # Packet 0 is discarded (1 of 5 entries)
+    assert history._start == 1
+    assert len(history._timestamps) == 5
+    history.append(5, 5000, packet(5.0))  # Packet 1 is discarded (2 of 6 entries)
+    assert history._start == 2
+    history.append(6, 6000, packet(6.0))  # Packet 2 is discarded (3 of 7 entries)
+    assert history._start == 3
+    history.append(7, 7000, packet(7.0))  # 4 of 8 entries are discarded, so the lists are compacted
+    assert history._start == 0
+    assert len(history._timestamps) == 4
+    assert history.get_range(0, 10 ** 9, timestamps=True)[1] == [4000, 5000, 6000, 7000]
+    assert history.get_numbers(5, 6)[1] == [[5.0, 6.0]]
+
+
+def test_out_of_order():
+    history = DataHistory([2, 1], max_duration=10)
+    fill(history, 5)
+    assert not history.append(5, 3000, packet(5.0))  # Timestamp decreases
+    assert not history.append(4, 5000, packet(5.0))  # Number does not increase
+    assert history.append(5, 4000, packet(5.0))  # Equal timestamps are allowed
+    assert history.get_range(0, 10 ** 9, timestamps=True)[1] == [0, 1000, 2000, 3000, 4000, 4000]
+    assert history.get_range(4000, 4000)[1] == [[4.0, 5.0]]
+
+
+def test_clear():
+    history = DataHistory([2, 1])
+    fill(history, 5)
+    history.clear()
+    assert len(history) == 0
+    assert history.size == 0
+    assert history.append(0, 0, packet(0.0))
@@ -0,0 +1,54 @@
+# This file is part of PyTIAClient.
+# This project is licensed under the GNU GPL (version 3 or higher).
+# Copyright 2014 by Clemens Brunner.
+
+
+import json
+import time
+
+from pytiaclient.__main__ import main
+
+
+def test_info(capsys):
+    assert main(["info", "--simulate"]) == 0
+    out = capsys.readouterr().out
+    assert "Signal group 0: type=eeg, samplingRate=256, numChannels=8, blockSize=8" in out
+    assert "Channels: button1" in out
+
+
+def test_capture(tmpdir):
+    output = str(tmpdir.join("data.json"))
+    assert main(["capture", output, "--simulate", "--duration", "0.2"]) == 0
+    with open(output) as f:
+        capture = json.load(f)
+    assert len(capture["timestamps"]) > 0
+    assert len(capture["data"][0][0]) == 8 * len(capture["timestamps"])
+    assert capture["stats"]["resyncs"] == 0
+
+
+def test_bench(capsys):
+    assert main(["bench", "--simulate", "--duration", "0.5"]) == 0
+    out = capsys.readouterr().out
+    assert "packets/s" in out
+    assert "Lost packets: 0, skipped bytes: 0, resyncs: 0" in out
+
+
+def test_connection_error(capsys):
+    assert main(["info", "--port", "1"]) == 1
+    assert "Cannot establish control connection" in capsys.readouterr().err
+
+
+def test_monitor_duration(capsys):
+    start = time.time()
+    assert main(["monitor", "--simulate", "--duration", "0.5", "--interval", "0.2"]) == 0
+    assert time.time() - start < 1.5
+    assert len(capsys.readouterr().out.splitlines()) == 3  # The last report covers the remaining 0.1 s
+
+
+def test_capture_zero_duration(tmpdir):
+    output = str(tmpdir.join("data.json"))
+    assert main(["capture", output, "--simulate", "--duration", "0"]) == 0
+    with open(output) as f:
+        capture = json.load(f)
+    assert capture["timestamps"] == []
+    assert capture["data"] == [[[] for _ in range(8)], [[]]]
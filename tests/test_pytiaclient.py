@@ -0,0 +1,223 @@
+# This file is part of PyTIAClient.
+# This project is licensed under the GNU GPL (version 3 or higher).
+# Copyright 2014 by Clemens Brunner.
+
+
+import struct
+import threading
+import time
+
+import pytest
+
+from pytiaclient import TIAClient, TIAError, TIASimulator, DataHistory
+from pytiaclient.pytiaclient import MAX_NUMBER_GAP
+
+
+FLAGS = 1 << 0 | 1 << 6  # EEG and button signal groups of the default simulator
+
+
+def make_packet(number, timestamp=None, flags=FLAGS, value=None):
+    """Creates a data packet matching the default simulator signals (EEG 8x8, button 1x1)."""
+    if timestamp is None:
+        timestamp = 1000 * number
+    if value is None:
+        value = float(number)
+    body = struct.pack("<4H", 8, 1, 8, 1) + struct.pack("<65f", *([value] * 65))
+    return struct.pack("<BIIQQQ", 3, 33 + len(body), flags, 0, number, timestamp) + body
+
+
+@pytest.fixture
+def server():
+    simulator = TIASimulator()
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def client(server):
+    """Client connected to the simulator, ready to parse packets without a running data thread."""
+    client = TIAClient()
+    client.connect(*server.address)
+    client._clear_buffer()
+    client._history = DataHistory([8, 1], max_duration=60)
+    client._buffer_lock = threading.RLock()
+    client._buffer_avail = threading.Condition(client._buffer_lock)
+    yield client
+    client.close()
+
+
+def parse(client, data, chunk_size=None):
+    """Feeds data to the parser (optionally in chunks) and returns the unconsumed bytes."""
+    stream = bytearray()
+    chunk_size = chunk_size or len(data)
+    for start in range(0, len(data), chunk_size):
+        stream.extend(data[start:start + chunk_size])
+        del stream[:client._parse_stream(stream)]
+    return stream
+
+
+def test_metainfo(client):
+    metainfo = client.get_metainfo()
+    assert [signal["type"] for signal in metainfo["signals"]] == ["eeg", "button"]
+    assert [channel["label"] for channel in metainfo["signals"][1]["channels"]] == ["button1"]
+    metainfo["signals"][0]["channels"].clear()  # Modifying the copy does not affect the client
+    assert len(client.get_metainfo()["signals"][0]["channels"]) == 8
+
+
+def test_valid_packets(client):
+    assert not parse(client, make_packet(0) + make_packet(1) + make_packet(2))
+    data = client._buffer
+    assert client.get_stream_stats() == {"packets": 3, "lost": 0, "skipped_bytes": 0, "resyncs": 0}
+    assert data[0][0] == [0.0] * 8 + [1.0] * 8 + [2.0] * 8
+    assert data[1][0] == [0.0, 1.0, 2.0]
+
+
+def test_short_writes(client):
+    assert not parse(client, b"".join(make_packet(n) for n in range(5)), chunk_size=7)
+    assert client.get_stream_stats()["packets"] == 5
+    assert client.get_stream_stats()["skipped_bytes"] == 0
+
+
+def test_truncated_packet(client):
+    rest = parse(client, make_packet(0) + make_packet(1)[:100])
+    assert len(rest) == 100  # Incomplete packet is kept until the rest arrives
+    assert client.get_stream_stats()["packets"] == 1
+    assert not parse(client, bytes(rest) + make_packet(1)[100:])
+    assert client.get_stream_stats()["packets"] == 2
+
+
+def test_garbage_between_packets(client):
+    garbage = b"\x03garbage\x03\x00"
+    parse(client, make_packet(0) + garbage + make_packet(1) + make_packet(2))
+    stats = client.get_stream_stats()
+    assert stats == {"packets": 3, "lost": 0, "skipped_bytes": len(garbage), "resyncs": 1}
+
+
+def test_partial_packet_followed_by_packets(client):
+    parse(client, make_packet(0) + make_packet(1)[:40] + make_packet(2) + make_packet(3))
+    stats = client.get_stream_stats()
+    assert stats["packets"] == 3
+    assert stats["lost"] == 1
+    assert stats["skipped_bytes"] == 40
+    assert stats["resyncs"] == 1
+
+
+def test_partial_packet_at_chunk_boundary(client):
+    # The expected end of the truncated packet 1 coincides with the end of the received data
+    parse(client, make_packet(0))
+    rest = parse(client, make_packet(1)[:60] + make_packet(2)[:241])
+    assert len(rest) == 241
+    stats = client.get_stream_stats()
+    assert stats["packets"] == 1
+    assert stats["skipped_bytes"] == 60
+    assert stats["resyncs"] == 1
+    assert not parse(client, bytes(rest) + make_packet(2)[241:])
+    assert client._timestamps == [0, 2000]
+    assert client._buffer[1][0] == [0.0, 2.0]
+
+
+def test_spoofed_header(client):
+    # Plausible fixed header with an inconsistent size and variable header
+    spoofed = struct.pack("<BIIQQQ", 3, 33 + 4 + 4 * 65, FLAGS, 0, 1, 1000) + struct.pack("<4H", 2, 2, 2, 2)
+    parse(client, make_packet(0) + spoofed + make_packet(1))
+    stats = client.get_stream_stats()
+    assert stats["packets"] == 2
+    assert stats["skipped_bytes"] == len(spoofed)
+    assert stats["resyncs"] == 1
+
+
+def test_unknown_flags(client):
+    parse(client, make_packet(0) + make_packet(1, flags=FLAGS | 1 << 3) + make_packet(2))
+    stats = client.get_stream_stats()
+    assert stats["packets"] == 2
+    assert stats["resyncs"] == 1
+
+
+def test_corrupted_number(client):
+    parse(client, make_packet(0) + make_packet(10 ** 12, timestamp=1000) + make_packet(1) + make_packet(2) +
+          make_packet(3))
+    stats = client.get_stream_stats()
+    assert stats["packets"] == 4
+    assert stats["lost"] == 0
+    assert stats["resyncs"] == 1
+    assert client._timestamps == [0, 1000, 2000, 3000]
+
+
+def test_corrupted_timestamp(client):
+    parse(client, make_packet(0) + make_packet(1, timestamp=2 ** 60) + make_packet(2) + make_packet(3))
+    assert client._timestamps == [0, 2000, 3000]
+    assert client.get_stream_stats()["lost"] == 1
+    assert client.get_latest(1, timestamps=True)[1] == [0, 2000, 3000]
+
+
+def test_new_sequence(client):
+    start = MAX_NUMBER_GAP * 10
+    parse(client, b"".join(make_packet(n) for n in range(start, start + 3)))
+    parse(client, b"".join(make_packet(n) for n in range(5)))
+    stats = client.get_stream_stats()
+    assert stats["packets"] == 6  # The first two packets of the new sequence are dropped before re-anchoring
+    assert stats["lost"] == 0
+    assert client._timestamps[-3:] == [2000, 3000, 4000]
+    assert client.get_latest(60, timestamps=True)[1] == [2000, 3000, 4000]  # History restarts with the new sequence
+
+
+def test_streaming(server):
+    client = TIAClient()
+    client.connect(*server.address)
+    client.start_data()
+    data = client.get_data_chunk(blocking=True)
+    time.sleep(0.1)
+    client.stop_data()
+    client.close()
+    assert len(data[0]) == 8
+    assert client.get_stream_stats()["packets"] > 0
+    assert client.get_stream_stats()["resyncs"] == 0
+
+
+def test_server_closes_data_connection(server):
+    client = TIAClient()
+    client.connect(*server.address)
+    client.start_data()
+    errors = []
+
+    def read():
+        try:
+            while True:
+                client.get_data_chunk(blocking=True)
+        except TIAError as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    time.sleep(0.1)
+    server._stop_streaming()  # Closes the data connection without StopDataTransmission
+    reader.join(3)
+    assert not reader.is_alive()  # Waiting readers are woken up
+    assert len(errors) == 1
+    client._data_thread.join(3)
+    assert client._sock_data is None
+    client.close()
+    assert client._data_thread is None
+
+
+def test_simulator_concurrent_stop(server):
+    client = TIAClient()
+    client.connect(*server.address)
+    client.start_data()
+    client.get_data_chunk(blocking=True)
+    errors = []
+
+    def stop():
+        try:
+            server._stop_streaming()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=stop) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(3)
+    assert not errors
+    client.close()